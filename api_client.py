@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+API Service Client
+Shared HTTP session and control-socket plumbing for the publisher and subscriber
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+import json
+import os
+import zmq
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# (connect, read) timeouts in seconds for calls to the API service
+REQUEST_TIMEOUT = (0.5, 2.0)
+
+# How long to wait for the ZMQ control socket to accept or answer a request
+CONTROL_TIMEOUT_MS = 2000
+
+class APIClient:
+    def __init__(self, api_base_url=None, control_context: zmq.Context = None):
+        self.api_base_url = api_base_url or os.getenv('API_URL', 'http://localhost:5000')
+        
+        # Registration goes over the ZMQ control socket unless API_CONTROL=rest
+        self.control_url = os.getenv('API_CONTROL_URL', 'tcp://localhost:5555')
+        self.use_rest_control = os.getenv('API_CONTROL', 'zmq') == 'rest'
+        # Registration is synchronous, so control requests need a blocking context
+        self._control_ctx = control_context or zmq.Context.instance()
+        
+        # Reuse one keep-alive connection instead of a new TCP handshake per request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _control_request(self, action: str, payload: dict, rest_path: str) -> dict:
+        """Send a control request over ZMQ REQ/REP, falling back to the REST endpoint"""
+        if not self.use_rest_control:
+            req = self._control_ctx.socket(zmq.REQ)
+            req.setsockopt(zmq.LINGER, 0)
+            # IMMEDIATE makes send fail unless a connection is up, so a send
+            # timeout means the request never left and REST is safe to try
+            req.setsockopt(zmq.IMMEDIATE, 1)
+            req.setsockopt(zmq.SNDTIMEO, CONTROL_TIMEOUT_MS)
+            req.setsockopt(zmq.RCVTIMEO, CONTROL_TIMEOUT_MS)
+            req.connect(self.control_url)
+            try:
+                try:
+                    req.send_json({"action": action, **payload})
+                except zmq.Again:
+                    print(f"⚠️  Control socket at {self.control_url} is unreachable, falling back to REST")
+                else:
+                    try:
+                        reply = req.recv()
+                    except zmq.Again:
+                        # The service may still act on the request, so retrying over
+                        # REST could register us twice
+                        return {"status": "error", "message": f"No reply from control socket at {self.control_url}"}
+                    try:
+                        result = json.loads(reply)
+                    except ValueError:
+                        result = None
+                    if isinstance(result, dict):
+                        return result
+                    # Some other REP service holds the port (e.g. ClientServer/server.py
+                    # on 5555) and never saw the request as a registration
+                    print(f"⚠️  Control socket at {self.control_url} sent a malformed reply {reply[:40]!r}, "
+                          f"is another service using that port? Falling back to REST")
+            finally:
+                req.close()
+        
+        response = self.session.post(f"{self.api_base_url}{rest_path}", json=payload, timeout=REQUEST_TIMEOUT)
+        return response.json()
@@ -9,18 +9,55 @@ import json
 import time
 import sys
 import os
-from random import randrange
+import zmq
+import numpy as np
+from typing import Union
 from dotenv import load_dotenv
+from api_client import APIClient, REQUEST_TIMEOUT
 
 # Load environment variables
 load_dotenv()
 
-class APIPublisher:
-    def __init__(self, api_base_url=None):
-        self.api_base_url = api_base_url or os.getenv('API_URL', 'http://localhost:5000')
+# Messages the PUB socket queues per subscriber before dropping; bounded because
+# every connected SUB, read or not, can hold this many
+PUB_SNDHWM = int(os.getenv('PUB_SNDHWM', 10_000))
+
+# Number of pregenerated weather samples; must be a power of two
+WEATHER_SAMPLES = 65536
+
+class APIPublisher(APIClient):
+    def __init__(self, api_base_url=None, direct: bool = True, heartbeat_every: int = 10,
+                 batch_size: int = 1, flush_interval: float = 0.05):
+        super().__init__(api_base_url)
         self.topic = None
         self.address = None
         self.port = None
+        
+        # In direct mode messages go straight out of our own PUB socket and the
+        # API service is only contacted every `heartbeat_every` messages
+        self.direct = direct
+        self.heartbeat_every = heartbeat_every
+        self.publish_count = 0
+        self.subscriber_count = 0
+        self._zctx = zmq.Context.instance()
+        self._pub = None
+        self._prefix = None  # b"<topic> " frame sent ahead of every payload
+        
+        # When routing through the API service, messages are buffered and sent to
+        # /publish/batch once `batch_size` are queued or `flush_interval` seconds pass
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buf = []
+        self._last_flush = time.monotonic()
+        
+        # Draw all (zipcode, temperature, humidity) samples in one vectorized call
+        # and cycle through them instead of calling randrange per field per tick
+        self._rand = np.stack([
+            np.random.randint(1, 100000, WEATHER_SAMPLES),
+            np.random.randint(-80, 135, WEATHER_SAMPLES),
+            np.random.randint(10, 60, WEATHER_SAMPLES)
+        ], axis=1).tolist()
+        self._ri = 0
     
     def register(self, topic: str, address: str = "localhost", port: int = 5556):
         """Register this publisher with the API service"""
@@ -28,44 +65,108 @@ class APIPublisher:
         self.address = address
         self.port = port
         
+        # Bind before registering so discovery never points subscribers at a
+        # port this publisher could not take
+        if self.direct:
+            try:
+                port = self._open_pub_socket(topic, port)
+            except zmq.ZMQError as e:
+                print(f"⚠️  Could not bind tcp://*:{port} ({e}), publishing through the API service")
+                self.direct = False
+        
         payload = {
             "topic": topic,
             "address": address,
-            "port": port
+            "port": port,
+            "direct": self.direct
         }
         
         try:
-            response = requests.post(f"{self.api_base_url}/register/publisher", json=payload)
-            result = response.json()
+            result = self._control_request("register_publisher", payload, "/register/publisher")
             
             if result["status"] == "success":
+                # The service may serve the topic on a port other than the one requested
+                self.port = result["publisher"]["port"]
                 print(f"✅ Publisher registered successfully for topic '{topic}'")
-                print(f"   Address: {address}:{port}")
+                print(f"   Address: {address}:{self.port}")
+                if self.direct:
+                    print(f"🔗 Publishing directly on tcp://*:{self.port}")
                 return True
-            else:
-                print(f"❌ Failed to register publisher: {result['message']}")
-                return False
+            
+            self._close_pub_socket()
+            if self.direct and result.get("reason") == "topic_served":
+                # The service already owns a PUB socket for this topic; send through it
+                print(f"⚠️  {result['message']}, publishing through the API service")
+                self.direct = False
+                return self.register(topic, address, port)
+            
+            print(f"❌ Failed to register publisher: {result['message']}")
+            return False
                 
         except requests.exceptions.ConnectionError:
+            self._close_pub_socket()
             print(f"❌ Could not connect to API service. Make sure it's running on {self.api_base_url}")
             return False
         except Exception as e:
+            self._close_pub_socket()
             print(f"❌ Error registering publisher: {e}")
             return False
     
-    def publish_message(self, message: str):
+    def _open_pub_socket(self, topic: str, port: int) -> int:
+        """Create and bind this publisher's own PUB socket, returning the bound port"""
+        socket = self._zctx.socket(zmq.PUB)
+        socket.setsockopt(zmq.SNDHWM, PUB_SNDHWM)
+        socket.setsockopt(zmq.SNDBUF, 4 << 20)
+        socket.setsockopt(zmq.LINGER, 0)
+        try:
+            try:
+                socket.bind(f"tcp://*:{port}")
+            except zmq.ZMQError as e:
+                if e.errno != zmq.EADDRINUSE:
+                    raise
+                # Another publisher holds the preferred port; take any free one
+                # and register that instead
+                requested, port = port, socket.bind_to_random_port("tcp://*")
+                print(f"⚠️  Port {requested} is in use, bound tcp://*:{port} instead")
+        except zmq.ZMQError:
+            socket.close()
+            raise
+        self._pub = socket
+        self._prefix = (topic + ' ').encode()
+        return port
+    
+    def _close_pub_socket(self):
+        """Close this publisher's own PUB socket, if it has one"""
+        if self._pub:
+            self._pub.close(linger=0)
+            self._pub = None
+    
+    def publish_message(self, message: Union[str, bytes]):
         """Publish a message to the registered topic"""
         if not self.topic:
             print("❌ Publisher not registered. Call register() first.")
             return False
         
+        if self.direct:
+            return self._publish_direct(message)
+        
+        # The REST path carries messages as JSON strings
+        if isinstance(message, bytes):
+            message = message.decode()
+        
+        if self.batch_size > 1:
+            self._buf.append(message)
+            if len(self._buf) >= self.batch_size or time.monotonic() - self._last_flush > self.flush_interval:
+                return self.flush()
+            return True
+        
         payload = {
             "topic": self.topic,
             "message": message
         }
         
         try:
-            response = requests.post(f"{self.api_base_url}/publish", json=payload)
+            response = self.session.post(f"{self.api_base_url}/publish", json=payload, timeout=REQUEST_TIMEOUT)
             result = response.json()
             
             if result["status"] == "success":
@@ -83,13 +184,78 @@ class APIPublisher:
             print(f"❌ Error publishing message: {e}")
             return False
     
+    def flush(self):
+        """Send any buffered messages to the API service in one batch request"""
+        self._last_flush = time.monotonic()
+        if not self._buf:
+            return True
+        
+        messages, self._buf = self._buf, []
+        payload = {
+            "topic": self.topic,
+            "messages": messages
+        }
+        
+        try:
+            response = self.session.post(f"{self.api_base_url}/publish/batch", json=payload, timeout=REQUEST_TIMEOUT)
+            result = response.json()
+            
+            if result["status"] == "success":
+                print(f"📤 Published {result['published_count']} messages to '{self.topic}'")
+                print(f"   Sent to {result['subscriber_count']} subscribers")
+                return True
+            else:
+                print(f"❌ Failed to publish batch: {result['message']}")
+                return False
+                
+        except requests.exceptions.ConnectionError:
+            print("❌ Could not connect to API service")
+            return False
+        except Exception as e:
+            print(f"❌ Error publishing batch: {e}")
+            return False
+    
+    def _publish_direct(self, message: Union[str, bytes]):
+        """Send a message on our own PUB socket, bypassing the API service"""
+        payload = message if isinstance(message, bytes) else message.encode()
+        try:
+            self._pub.send_multipart([self._prefix, payload], flags=zmq.DONTWAIT, copy=False)
+        except zmq.Again:
+            print(f"❌ Dropped message for '{self.topic}': send queue is full")
+            return False
+        
+        self.publish_count += 1
+        if (self.publish_count - 1) % self.heartbeat_every == 0:
+            self._heartbeat()
+        
+        print(f"📤 Published to '{self.topic}': {payload.decode()}")
+        print(f"   Sent to {self.subscriber_count} subscribers")
+        return True
+    
+    def _heartbeat(self):
+        """Refresh the subscriber count from the API service"""
+        try:
+            response = self.session.get(f"{self.api_base_url}/topics/{self.topic}", timeout=REQUEST_TIMEOUT)
+            if response.status_code == 200:
+                self.subscriber_count = response.json()["subscriber_count"]
+        except requests.exceptions.RequestException:
+            # Keep publishing with the last known count if the service is unreachable
+            pass
+    
+    def close(self):
+        """Flush pending messages and release the PUB socket and HTTP session"""
+        if self._buf:
+            self.flush()
+        self._close_pub_socket()
+        self.session.close()
+    
     def publish_weather_data(self):
         """Publish random weather data (like the original publisher)"""
-        zipcode = randrange(1, 100000)
-        temperature = randrange(-80, 135)
-        relhumidity = randrange(10, 60)
+        zipcode, temperature, relhumidity = self._rand[self._ri]
+        self._ri = (self._ri + 1) & (WEATHER_SAMPLES - 1)
         
-        message = f"{zipcode} {temperature} {relhumidity}"
+        # Formatted straight to bytes so the direct path never encodes
+        message = b"%d %d %d" % (zipcode, temperature, relhumidity)
         return self.publish_message(message)
 
 def main():
@@ -121,6 +287,8 @@ def main():
             
     except KeyboardInterrupt:
         print("\n👋 Publisher stopped by user")
+    finally:
+        publisher.close()
 
 if __name__ == "__main__":
     main()
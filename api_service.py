@@ -4,160 +4,343 @@ External API Service for Pub/Sub System
 Handles ZeroMQ orchestration and routing
 """
 
-import zmq
 import json
-import threading
+import orjson
+import asyncio
+import contextlib
 import time
 import os
-from typing import Dict, List
-from flask import Flask, request, jsonify
+import zmq
+import zmq.asyncio
+import uvicorn
+from typing import Dict, List, Optional, Tuple, Union
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
 from dotenv import load_dotenv
 from discovery_service import discovery_service
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+# Messages a PUB socket queues per subscriber before dropping; bounded because
+# every connected SUB, read or not, can hold this many
+PUB_SNDHWM = int(os.getenv('PUB_SNDHWM', 10_000))
+
+def oj(obj, status: int = 200) -> Response:
+    """Build a JSON response with orjson instead of the stdlib encoder"""
+    return Response(orjson.dumps(obj), status_code=status, media_type='application/json')
 
 class ZeroMQOrchestrator:
     def __init__(self):
-        self.context = zmq.Context()
-        self.publisher_sockets: Dict[str, zmq.Socket] = {}  # topic -> socket
-        self.subscriber_sockets: Dict[str, List[zmq.Socket]] = {}  # topic -> list of sockets
-        self.lock = threading.RLock()
+        # All methods run on the event loop thread, so registration needs no lock
+        self.context = zmq.asyncio.Context.instance()  # shared process-wide
+        self.publisher_sockets: Dict[str, zmq.asyncio.Socket] = {}  # topic -> socket
+        self.publisher_ports: Dict[str, int] = {}  # topic -> bound port
+        self.subscriber_sockets: Dict[str, List[zmq.asyncio.Socket]] = {}  # topic -> list of sockets
+        # Keeps sends on one topic ordered across awaits; other topics proceed independently
+        self._send_locks: Dict[str, asyncio.Lock] = {}  # topic -> lock
+        # Topic prefix frames encoded once at registration
+        self._topic_prefix: Dict[str, bytes] = {}  # topic -> b"<topic> "
+        # Blocking views of the PUB sockets for batches that never need to await
+        self._sync_sockets: Dict[str, zmq.Socket] = {}  # topic -> socket
     
-    def create_publisher_socket(self, topic: str, port: int) -> zmq.Socket:
+    def create_publisher_socket(self, topic: str, port: int) -> zmq.asyncio.Socket:
         """Create a publisher socket for a topic"""
-        with self.lock:
-            if topic not in self.publisher_sockets:
-                socket = self.context.socket(zmq.PUB)
-                socket.bind(f"tcp://*:{port}")
-                self.publisher_sockets[topic] = socket
-                print(f"Created publisher socket for topic '{topic}' on port {port}")
-            return self.publisher_sockets[topic]
-    
-    def create_subscriber_socket(self, topic: str, publisher_address: str, publisher_port: int) -> zmq.Socket:
+        if topic not in self.publisher_sockets:
+            socket = self.context.socket(zmq.PUB)
+            # Queue a bounded backlog per subscriber, and never hold the
+            # process open on unsent messages
+            socket.setsockopt(zmq.SNDHWM, PUB_SNDHWM)
+            socket.setsockopt(zmq.SNDBUF, 4 << 20)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.bind(f"tcp://*:{port}")
+            self._send_locks[topic] = asyncio.Lock()
+            self._topic_prefix[topic] = (topic + ' ').encode()
+            self._sync_sockets[topic] = zmq.Socket.shadow(socket.underlying)
+            self.publisher_sockets[topic] = socket
+            self.publisher_ports[topic] = port
+            print(f"Created publisher socket for topic '{topic}' on port {port}")
+        return self.publisher_sockets[topic]
+    
+    def create_subscriber_socket(self, topic: str, publisher_address: str, publisher_port: int) -> zmq.asyncio.Socket:
         """Create a subscriber socket for a topic"""
-        with self.lock:
-            socket = self.context.socket(zmq.SUB)
-            connect_str = f"tcp://{publisher_address}:{publisher_port}"
-            socket.connect(connect_str)
-            socket.setsockopt_string(zmq.SUBSCRIBE, topic)
-            
-            if topic not in self.subscriber_sockets:
-                self.subscriber_sockets[topic] = []
-            self.subscriber_sockets[topic].append(socket)
-            
-            print(f"Created subscriber socket for topic '{topic}' connecting to {connect_str}")
-            return socket
-    
-    def publish_message(self, topic: str, message: str) -> dict:
+        socket = self.context.socket(zmq.SUB)
+        connect_str = f"tcp://{publisher_address}:{publisher_port}"
+        socket.connect(connect_str)
+        socket.setsockopt_string(zmq.SUBSCRIBE, topic)
+        
+        if topic not in self.subscriber_sockets:
+            self.subscriber_sockets[topic] = []
+        self.subscriber_sockets[topic].append(socket)
+        
+        print(f"Created subscriber socket for topic '{topic}' connecting to {connect_str}")
+        return socket
+    
+    async def publish_message(self, topic: str, message: Union[str, bytes]) -> dict:
         """Publish a message to all subscribers of a topic"""
-        with self.lock:
-            if topic not in self.publisher_sockets:
-                return {"status": "error", "message": f"No publisher socket found for topic '{topic}'"}
-            
-            socket = self.publisher_sockets[topic]
-            socket.send_string(f"{topic} {message}")
-            
-            # Get subscriber count for response
-            subscribers = discovery_service.get_subscribers_for_topic(topic)
-            
+        socket = self.publisher_sockets.get(topic)
+        if socket is None:
+            return {"status": "error", "message": f"No publisher socket found for topic '{topic}'"}
+        
+        # Sent as [prefix, payload] frames so the topic string is never re-encoded
+        prefix = self._topic_prefix[topic]
+        # str() keeps non-string JSON values (e.g. numbers) publishable as before
+        payload = message if isinstance(message, bytes) else str(message).encode()
+        try:
+            async with self._send_locks[topic]:
+                await socket.send_multipart([prefix, payload], flags=zmq.DONTWAIT, copy=False)
+        except zmq.Again:
+            return {"status": "dropped", "message": f"Send queue full for topic '{topic}'"}
+        
+        # Get subscriber count for response
+        subscribers = discovery_service.get_subscribers_for_topic(topic)
+        
+        return {
+            "status": "success",
+            "message": f"Message published to topic '{topic}'",
+            "subscriber_count": len(subscribers),
+            "published_message": message
+        }
+    
+    async def publish_many(self, topic: str, messages: List[Union[str, bytes]]) -> dict:
+        """Publish a batch of messages to a topic under a single lock acquisition"""
+        socket = self._sync_sockets.get(topic)
+        if socket is None:
+            return {"status": "error", "message": f"No publisher socket found for topic '{topic}'"}
+        
+        prefix = self._topic_prefix[topic]
+        # Encode everything up front so a bad element cannot fail a half-sent batch
+        payloads = [m if isinstance(m, bytes) else str(m).encode() for m in messages]
+        sent = 0
+        async with self._send_locks[topic]:
+            # DONTWAIT sends never suspend, so issue them back-to-back on the
+            # blocking socket instead of creating and awaiting a future per
+            # message; libzmq can then coalesce the frames into fewer writes
+            for payload in payloads:
+                try:
+                    socket.send_multipart([prefix, payload], flags=zmq.DONTWAIT, copy=False)
+                except zmq.Again:
+                    break
+                sent += 1
+        
+        if sent < len(messages):
             return {
-                "status": "success",
-                "message": f"Message published to topic '{topic}'",
-                "subscriber_count": len(subscribers),
-                "published_message": message
+                "status": "dropped",
+                "message": f"Send queue full for topic '{topic}' after {sent} messages",
+                "published_count": sent
             }
+        
+        subscribers = discovery_service.get_subscribers_for_topic(topic)
+        
+        return {
+            "status": "success",
+            "message": f"{sent} messages published to topic '{topic}'",
+            "subscriber_count": len(subscribers),
+            "published_count": sent
+        }
 
 # Global orchestrator instance
 orchestrator = ZeroMQOrchestrator()
 
-@app.route('/register/publisher', methods=['POST'])
-def register_publisher():
+def handle_register_publisher(data: dict) -> Tuple[dict, int]:
+    """Register a new publisher; shared by the REST route and the control socket"""
+    topic = data.get('topic')
+    address = data.get('address', 'localhost')
+    port = data.get('port', 5556)
+    
+    if not topic:
+        return {"status": "error", "message": "Topic is required"}, 400
+    
+    # Direct publishers bind their own PUB socket, so only create one here
+    # for publishers that route messages through /publish. The socket is
+    # bound first so a failed bind never leaves a publisher in discovery.
+    if data.get('direct', False):
+        if topic in orchestrator.publisher_sockets:
+            return {
+                "status": "error",
+                "reason": "topic_served",
+                "message": f"Topic '{topic}' is already published by the API service"
+            }, 409
+    else:
+        if topic not in orchestrator.publisher_sockets and discovery_service.get_publishers_for_topic(topic):
+            # Publishers without a socket here bind their own, so the port they
+            # hold cannot be shared by a publisher routing through /publish
+            return {
+                "status": "error",
+                "reason": "topic_served_direct",
+                "message": f"Topic '{topic}' is already published directly by another publisher; register with direct=True"
+            }, 409
+        try:
+            orchestrator.create_publisher_socket(topic, port)
+        except zmq.ZMQError as e:
+            if e.errno != zmq.EADDRINUSE:
+                raise
+            return {
+                "status": "error",
+                "reason": "port_in_use",
+                "message": f"Port {port} for topic '{topic}' is already in use"
+            }, 409
+        # A topic already served here keeps its original port
+        port = orchestrator.publisher_ports[topic]
+    
+    # Register with discovery service
+    result = discovery_service.register_publisher(topic, address, port)
+    
+    return result, 200
+
+def handle_register_subscriber(data: dict) -> Tuple[dict, int]:
+    """Register a new subscriber; shared by the REST route and the control socket"""
+    topic = data.get('topic')
+    address = data.get('address', 'localhost')
+    port = data.get('port', 5557)
+    
+    if not topic:
+        return {"status": "error", "message": "Topic is required"}, 400
+    
+    # Check if there are publishers for this topic
+    publishers = discovery_service.get_publishers_for_topic(topic)
+    if not publishers:
+        return {"status": "error", "message": f"No publishers found for topic '{topic}'"}, 404
+    
+    # Register with discovery service
+    result = discovery_service.register_subscriber(topic, address, port)
+    
+    # Create ZeroMQ subscriber socket for each publisher
+    for publisher in publishers:
+        orchestrator.create_subscriber_socket(topic, publisher.address, publisher.port)
+    
+    # Include publisher addresses so the subscriber can connect without a
+    # follow-up GET /topics/<topic>
+    result["publishers"] = list(discovery_service.get_publisher_dicts_for_topic(topic))
+    
+    return result, 200
+
+# Control socket actions -> handlers
+CONTROL_HANDLERS = {
+    "register_publisher": handle_register_publisher,
+    "register_subscriber": handle_register_subscriber,
+}
+
+async def _control_loop(socket: zmq.asyncio.Socket):
+    """Serve control requests on a REP socket"""
+    while True:
+        try:
+            data = orjson.loads(await socket.recv())
+            handler = CONTROL_HANDLERS.get(data.get('action'))
+            if handler is None:
+                result = {"status": "error", "message": f"Unknown action '{data.get('action')}'"}
+            else:
+                result, _ = handler(data)
+        except zmq.ContextTerminated:
+            break
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        # REP must answer every request before it can receive the next one
+        await socket.send(orjson.dumps(result))
+
+def start_control_server(port: int = None) -> Optional[asyncio.Task]:
+    """Bind the REQ/REP control socket and serve it as a task on the running loop"""
+    port = port or int(os.getenv('CONTROL_PORT', 5555))
+    socket = orchestrator.context.socket(zmq.REP)
+    socket.setsockopt(zmq.LINGER, 0)
+    try:
+        socket.bind(f"tcp://*:{port}")
+    except zmq.ZMQError as e:
+        # The control plane is optional; clients fall back to REST without it
+        socket.close()
+        print(f"Control socket disabled, could not bind tcp://*:{port}: {e}")
+        return None
+    task = asyncio.create_task(_control_loop(socket))
+    task.add_done_callback(lambda _: socket.close())
+    print(f"Control socket listening on tcp://*:{port}")
+    return task
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    """Run the control socket for as long as the ASGI app is being served"""
+    task = start_control_server()
+    yield
+    if task is not None:
+        task.cancel()
+
+async def register_publisher(request: Request) -> Response:
     """Register a new publisher"""
     try:
-        data = request.get_json()
-        topic = data.get('topic')
-        address = data.get('address', 'localhost')
-        port = data.get('port', 5556)
-        
-        if not topic:
-            return jsonify({"status": "error", "message": "Topic is required"}), 400
-        
-        # Register with discovery service
-        result = discovery_service.register_publisher(topic, address, port)
-        
-        # Create ZeroMQ publisher socket
-        orchestrator.create_publisher_socket(topic, port)
-        
-        return jsonify(result)
+        data = orjson.loads(await request.body())
+        result, status = handle_register_publisher(data)
+        return oj(result, status)
     
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return oj({"status": "error", "message": str(e)}, 500)
 
-@app.route('/register/subscriber', methods=['POST'])
-def register_subscriber():
+async def register_subscriber(request: Request) -> Response:
     """Register a new subscriber"""
     try:
-        data = request.get_json()
-        topic = data.get('topic')
-        address = data.get('address', 'localhost')
-        port = data.get('port', 5557)
-        
-        if not topic:
-            return jsonify({"status": "error", "message": "Topic is required"}), 400
-        
-        # Check if there are publishers for this topic
-        publishers = discovery_service.get_publishers_for_topic(topic)
-        if not publishers:
-            return jsonify({"status": "error", "message": f"No publishers found for topic '{topic}'"}), 404
-        
-        # Register with discovery service
-        result = discovery_service.register_subscriber(topic, address, port)
-        
-        # Create ZeroMQ subscriber socket for each publisher
-        for publisher in publishers:
-            orchestrator.create_subscriber_socket(topic, publisher.address, publisher.port)
-        
-        return jsonify(result)
+        data = orjson.loads(await request.body())
+        result, status = handle_register_subscriber(data)
+        return oj(result, status)
     
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return oj({"status": "error", "message": str(e)}, 500)
 
-@app.route('/publish', methods=['POST'])
-def publish_message():
+async def publish_message(request: Request) -> Response:
     """Publish a message to a topic"""
     try:
-        data = request.get_json()
+        data = orjson.loads(await request.body())
         topic = data.get('topic')
         message = data.get('message')
         
         if not topic or not message:
-            return jsonify({"status": "error", "message": "Topic and message are required"}), 400
+            return oj({"status": "error", "message": "Topic and message are required"}, 400)
         
-        result = orchestrator.publish_message(topic, message)
-        return jsonify(result)
+        result = await orchestrator.publish_message(topic, message)
+        return oj(result)
     
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return oj({"status": "error", "message": str(e)}, 500)
 
-@app.route('/topics', methods=['GET'])
-def get_topics():
+async def publish_batch(request: Request) -> Response:
+    """Publish a batch of messages to a topic"""
+    try:
+        data = orjson.loads(await request.body())
+        topic = data.get('topic')
+        messages = data.get('messages')
+        
+        if not topic or not messages or not isinstance(messages, list):
+            return oj({"status": "error", "message": "Topic and a non-empty messages list are required"}, 400)
+        
+        result = await orchestrator.publish_many(topic, messages)
+        return oj(result)
+    
+    except Exception as e:
+        return oj({"status": "error", "message": str(e)}, 500)
+
+async def get_topics(request: Request) -> Response:
     """Get all registered topics"""
     topics = discovery_service.get_all_topics()
-    return jsonify({"topics": list(topics)})
+    return oj({"topics": list(topics)})
 
-@app.route('/topics/<topic>', methods=['GET'])
-def get_topic_stats(topic):
+async def get_topic_stats(request: Request) -> Response:
     """Get statistics for a specific topic"""
+    topic = request.path_params['topic']
     stats = discovery_service.get_topic_stats(topic)
-    return jsonify(stats)
+    return oj(stats)
 
-@app.route('/health', methods=['GET'])
-def health_check():
+async def health_check(request: Request) -> Response:
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "ZeroMQ API Service"})
+    return oj({"status": "healthy", "service": "ZeroMQ API Service"})
+
+app = Starlette(routes=[
+    Route('/register/publisher', register_publisher, methods=['POST']),
+    Route('/register/subscriber', register_subscriber, methods=['POST']),
+    Route('/publish', publish_message, methods=['POST']),
+    Route('/publish/batch', publish_batch, methods=['POST']),
+    Route('/topics', get_topics, methods=['GET']),
+    Route('/topics/{topic}', get_topic_stats, methods=['GET']),
+    Route('/health', health_check, methods=['GET']),
+], lifespan=lifespan)
 
 if __name__ == '__main__':
     # Get port from environment variable or use default
@@ -170,8 +353,11 @@ if __name__ == '__main__':
     print("  POST /register/publisher - Register a publisher")
     print("  POST /register/subscriber - Register a subscriber")
     print("  POST /publish - Publish a message")
+    print("  POST /publish/batch - Publish a batch of messages")
     print("  GET /topics - Get all topics")
     print("  GET /topics/<topic> - Get topic statistics")
     print("  GET /health - Health check")
     
-    app.run(host=host, port=port, debug=True)
+    # Auto-reload is only enabled when DEV is set
+    uvicorn.run("api_service:app", host=host, port=port, loop="uvloop", http="httptools",
+                reload=bool(os.getenv('DEV')))
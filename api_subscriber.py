@@ -10,23 +10,41 @@ import time
 import sys
 import threading
 import os
+import asyncio
 import zmq
+import zmq.asyncio
+import numpy as np
+from typing import List
 from dotenv import load_dotenv
+from api_client import APIClient
 
 # Load environment variables
 load_dotenv()
 
-class APISubscriber:
-    def __init__(self, api_base_url=None):
-        self.api_base_url = api_base_url or os.getenv('API_URL', 'http://localhost:5000')
+# Temperatures held before being folded into the running sum; must be a power of two
+TEMP_RING_SIZE = 65536
+
+class APISubscriber(APIClient):
+    def __init__(self, api_base_url=None, verbose: bool = False, stats_interval: float = 1.0):
+        self.context = zmq.asyncio.Context.instance()  # shared process-wide
+        # Control requests use a blocking view of the same context
+        super().__init__(api_base_url, zmq.Context.shadow(self.context.underlying))
         self.topic = None
         self.address = None
         self.port = None
-        self.context = zmq.Context()
+        
         self.socket = None
         self.running = False
         self.message_count = 0
-        self.total_temp = 0
+        # Temperatures land in a fixed-size ring that is summed with one
+        # vectorized reduce each time it fills, so memory stays constant
+        self._temps = np.empty(TEMP_RING_SIZE, dtype=np.int32)
+        self._temp_sum = 0
+        # Per-message output is opt-in; by default a background thread prints
+        # a rolling summary every `stats_interval` seconds
+        self.verbose = verbose
+        self.stats_interval = stats_interval
+        self._stats_stop = threading.Event()
     
     def register(self, topic: str, address: str = "localhost", port: int = 5557):
         """Register this subscriber with the API service"""
@@ -41,20 +59,15 @@ class APISubscriber:
         }
         
         try:
-            response = requests.post(f"{self.api_base_url}/register/subscriber", json=payload)
-            result = response.json()
+            result = self._control_request("register_subscriber", payload, "/register/subscriber")
             
             if result["status"] == "success":
                 print(f"✅ Subscriber registered successfully for topic '{topic}'")
                 print(f"   Address: {address}:{port}")
                 
-                # Get publisher information to connect directly
-                stats_response = requests.get(f"{self.api_base_url}/topics/{topic}")
-                if stats_response.status_code == 200:
-                    stats = stats_response.json()
-                    if stats["publishers"]:
-                        publisher = stats["publishers"][0]  # Connect to first publisher
-                        self._connect_to_publisher(publisher["address"], publisher["port"])
+                # The registration response lists publishers to connect to directly
+                if result.get("publishers"):
+                    self._connect_to_publishers(result["publishers"])
                 
                 return True
             else:
@@ -68,21 +81,24 @@ class APISubscriber:
             print(f"❌ Error registering subscriber: {e}")
             return False
     
-    def _connect_to_publisher(self, publisher_address: str, publisher_port: int):
-        """Connect directly to publisher using ZeroMQ"""
+    def _connect_to_publishers(self, publishers: List[dict]):
+        """Connect one SUB socket directly to every publisher of the topic"""
         try:
             self.socket = self.context.socket(zmq.SUB)
-            connect_str = f"tcp://{publisher_address}:{publisher_port}"
-            self.socket.connect(connect_str)
             self.socket.setsockopt_string(zmq.SUBSCRIBE, self.topic)
             
-            print(f"🔗 Connected to publisher at {connect_str}")
+            # Publishers routed through the API service share its socket, so
+            # connect to each distinct endpoint only once
+            endpoints = dict.fromkeys(f"tcp://{p['address']}:{p['port']}" for p in publishers)
+            for connect_str in endpoints:
+                self.socket.connect(connect_str)
+                print(f"🔗 Connected to publisher at {connect_str}")
             print(f"   Subscribed to topic: {self.topic}")
             
         except Exception as e:
             print(f"❌ Error connecting to publisher: {e}")
     
-    def start_listening(self, max_messages: int = 100):
+    async def start_listening(self, max_messages: int = 100):
         """Start listening for messages"""
         if not self.socket:
             print("❌ Not connected to any publisher. Call register() first.")
@@ -95,67 +111,93 @@ class APISubscriber:
         
         self.running = True
         self.message_count = 0
-        self.total_temp = 0
+        self._temp_sum = 0
+        
+        self._stats_stop.clear()
+        stats_thread = threading.Thread(target=self._stats_printer, daemon=True)
+        stats_thread.start()
         
         try:
             while self.running and self.message_count < max_messages:
                 try:
-                    # Set timeout to avoid blocking indefinitely
-                    if self.socket.poll(1000):  # 1 second timeout
-                        message = self.socket.recv_string()
-                        self._process_message(message)
-                    else:
-                        # No message received, continue
-                        continue
-                        
-                except zmq.Again:
-                    # Timeout occurred, continue
-                    continue
+                    # Suspends in the event loop until a message arrives
+                    message = await self.socket.recv_multipart(copy=False)
                 except Exception as e:
                     print(f"❌ Error receiving message: {e}")
                     break
+                
+                self._process_message(message)
             
             if self.message_count > 0:
-                avg_temp = self.total_temp / self.message_count
+                filled = self.message_count & (TEMP_RING_SIZE - 1)
+                total = self._temp_sum + int(np.add.reduce(self._temps[:filled], dtype=np.int64))
+                avg_temp = total / self.message_count
                 print(f"\n📊 Average temperature for topic '{self.topic}': {avg_temp:.1f}°F")
                 print(f"   Processed {self.message_count} messages")
             
-        except KeyboardInterrupt:
+        except asyncio.CancelledError:
+            # asyncio.run() cancels the listening task on Ctrl+C
             print("\n👋 Subscriber stopped by user")
         finally:
             self.running = False
+            self._stats_stop.set()
+            stats_thread.join()
+    
+    def _stats_printer(self):
+        """Print the message count and receive rate until listening stops"""
+        last_count = self.message_count
+        last_time = time.monotonic()
+        while not self._stats_stop.wait(self.stats_interval):
+            now = time.monotonic()
+            count = self.message_count
+            rate = (count - last_count) / (now - last_time)
+            print(f"📈 {count} messages received ({rate:.0f} msg/s)")
+            last_count, last_time = count, now
     
-    def _process_message(self, message: str):
+    def _process_message(self, frames: List[zmq.Frame]):
         """Process received message"""
+        # Publishers send [b"<topic> ", payload]; joining the frame buffers also
+        # handles single-frame "<topic> <payload>" messages
+        data = b"".join(frame.buffer for frame in frames)
+        # Only the temperature is parsed on the fast path
         try:
-            parts = message.split()
+            parts = data.split(b' ', 3)
             if len(parts) >= 3:
-                topic = parts[0]
-                zipcode = parts[1]
                 temperature = int(parts[2])
-                relhumidity = parts[3] if len(parts) > 3 else "N/A"
                 
+                slot = self.message_count & (TEMP_RING_SIZE - 1)
+                self._temps[slot] = temperature
                 self.message_count += 1
-                self.total_temp += temperature
+                if slot == TEMP_RING_SIZE - 1:
+                    # Ring is full; fold it into the running sum before it wraps
+                    self._temp_sum += int(np.add.reduce(self._temps, dtype=np.int64))
                 
-                print(f"📨 [{self.message_count:2d}] {topic}: Zip {zipcode}, Temp {temperature}°F, Humidity {relhumidity}%")
+                if self.verbose:
+                    topic = parts[0].decode()
+                    zipcode = parts[1].decode()
+                    relhumidity = parts[3].decode() if len(parts) > 3 else "N/A"
+                    print(f"📨 [{self.message_count:2d}] {topic}: Zip {zipcode}, Temp {temperature}°F, Humidity {relhumidity}%")
                 
-        except (ValueError, IndexError) as e:
-            print(f"❌ Error parsing message '{message}': {e}")
+        except (ValueError, IndexError, OverflowError) as e:
+            print(f"❌ Error parsing message '{data.decode(errors='replace')}': {e}")
     
     def stop(self):
         """Stop the subscriber"""
         self.running = False
         if self.socket:
-            self.socket.close()
-        self.context.term()
+            self.socket.close(linger=0)
+        self.session.close()
+        # The context is process-global, so it is left for other sockets to use
 
 def main():
     # Get topic from command line or use default
-    topic = sys.argv[1] if len(sys.argv) > 1 else "weather"
-    max_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    # Positional args are topic and max messages; --verbose prints every message
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    verbose = '--verbose' in sys.argv[1:]
+    topic = args[0] if len(args) > 0 else "weather"
+    max_messages = int(args[1]) if len(args) > 1 else 10
     
-    subscriber = APISubscriber()
+    subscriber = APISubscriber(verbose=verbose)
     api_url = subscriber.api_base_url
     
     print(f"🌤️  Starting API-based Weather Subscriber")
@@ -170,7 +212,10 @@ def main():
         return
     
     # Start listening for messages
-    subscriber.start_listening(max_messages)
+    try:
+        asyncio.run(subscriber.start_listening(max_messages))
+    except KeyboardInterrupt:
+        print("\n👋 Subscriber stopped by user")
     
     # Cleanup
     subscriber.stop()
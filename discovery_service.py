@@ -5,7 +5,7 @@ Manages topic registration and subscriber routing
 """
 
 import json
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Tuple
 from dataclasses import dataclass, asdict
 import threading
 import time
@@ -26,9 +26,15 @@ class Subscriber:
 
 class DiscoveryService:
     def __init__(self):
-        self.publishers: Dict[str, List[Publisher]] = {}  # topic -> list of publishers
-        self.subscribers: Dict[str, List[Subscriber]] = {}  # topic -> list of subscribers
-        self.lock = threading.RLock()
+        # Entries are (record, asdict(record)) so the dict form is computed only once
+        self.publishers: Dict[str, List[Tuple[Publisher, dict]]] = {}  # topic -> list of publishers
+        self.subscribers: Dict[str, List[Tuple[Subscriber, dict]]] = {}  # topic -> list of subscribers
+        # Read-only snapshots rebound after every registration so readers never lock
+        self._pubs_ro: Dict[str, Tuple[Publisher, ...]] = {}
+        self._subs_ro: Dict[str, Tuple[Subscriber, ...]] = {}
+        self._pub_dicts_ro: Dict[str, Tuple[dict, ...]] = {}
+        self._sub_dicts_ro: Dict[str, Tuple[dict, ...]] = {}
+        self.lock = threading.Lock()  # guards registration only; never re-entered
     
     def register_publisher(self, topic: str, address: str, port: int) -> dict:
         """Register a new publisher for a topic"""
@@ -38,12 +44,16 @@ class DiscoveryService:
             if topic not in self.publishers:
                 self.publishers[topic] = []
             
-            self.publishers[topic].append(publisher)
+            publisher_dict = asdict(publisher)
+            self.publishers[topic].append((publisher, publisher_dict))
+            entries = self.publishers[topic]
+            self._pubs_ro = {**self._pubs_ro, topic: tuple(p for p, _ in entries)}
+            self._pub_dicts_ro = {**self._pub_dicts_ro, topic: tuple(d for _, d in entries)}
             
             return {
                 "status": "success",
                 "message": f"Publisher registered for topic '{topic}'",
-                "publisher": asdict(publisher)
+                "publisher": publisher_dict
             }
     
     def register_subscriber(self, topic: str, address: str, port: int) -> dict:
@@ -54,44 +64,49 @@ class DiscoveryService:
             if topic not in self.subscribers:
                 self.subscribers[topic] = []
             
-            self.subscribers[topic].append(subscriber)
+            subscriber_dict = asdict(subscriber)
+            self.subscribers[topic].append((subscriber, subscriber_dict))
+            entries = self.subscribers[topic]
+            self._subs_ro = {**self._subs_ro, topic: tuple(s for s, _ in entries)}
+            self._sub_dicts_ro = {**self._sub_dicts_ro, topic: tuple(d for _, d in entries)}
             
             return {
                 "status": "success",
                 "message": f"Subscriber registered for topic '{topic}'",
-                "subscriber": asdict(subscriber)
+                "subscriber": subscriber_dict
             }
     
-    def get_publishers_for_topic(self, topic: str) -> List[Publisher]:
+    def get_publishers_for_topic(self, topic: str) -> Tuple[Publisher, ...]:
         """Get all publishers for a specific topic"""
-        with self.lock:
-            return self.publishers.get(topic, [])
+        return self._pubs_ro.get(topic, ())
+    
+    def get_publisher_dicts_for_topic(self, topic: str) -> Tuple[dict, ...]:
+        """Get the cached dict form of all publishers for a specific topic"""
+        return self._pub_dicts_ro.get(topic, ())
     
-    def get_subscribers_for_topic(self, topic: str) -> List[Subscriber]:
+    def get_subscribers_for_topic(self, topic: str) -> Tuple[Subscriber, ...]:
         """Get all subscribers for a specific topic"""
-        with self.lock:
-            return self.subscribers.get(topic, [])
+        return self._subs_ro.get(topic, ())
     
     def get_all_topics(self) -> Set[str]:
         """Get all registered topics"""
-        with self.lock:
-            topics = set(self.publishers.keys())
-            topics.update(self.subscribers.keys())
-            return topics
+        topics = set(self._pubs_ro.keys())
+        topics.update(self._subs_ro.keys())
+        return topics
     
     def get_topic_stats(self, topic: str) -> dict:
         """Get statistics for a topic"""
-        with self.lock:
-            publisher_count = len(self.publishers.get(topic, []))
-            subscriber_count = len(self.subscribers.get(topic, []))
-            
-            return {
-                "topic": topic,
-                "publisher_count": publisher_count,
-                "subscriber_count": subscriber_count,
-                "publishers": [asdict(p) for p in self.publishers.get(topic, [])],
-                "subscribers": [asdict(s) for s in self.subscribers.get(topic, [])]
-            }
+        # Take each snapshot once so counts and lists agree
+        publishers = self._pub_dicts_ro.get(topic, ())
+        subscribers = self._sub_dicts_ro.get(topic, ())
+        
+        return {
+            "topic": topic,
+            "publisher_count": len(publishers),
+            "subscriber_count": len(subscribers),
+            "publishers": list(publishers),
+            "subscribers": list(subscribers)
+        }
 
 # Global discovery service instance
 discovery_service = DiscoveryService()